@@ -0,0 +1,49 @@
+from __future__ import absolute_import
+
+import importlib
+
+import six
+
+__all__ = ["get_backend_class", "register_backend"]
+
+# Builtin backends, by name. Values are dotted paths so that a backend's
+# module (and its client library) is only imported when it is first used.
+_backends = {
+    "redis": "activity_tracker.backends.redis.RedisBackend",
+}
+_backend_classes = {}
+
+
+def register_backend(name, backend_class):
+    """Register a backend under a short name.
+
+    Arguments:
+        name:          The name to pass as ActivityTracker(backend=name).
+        backend_class: A subclass of activity_tracker.backends.base.BaseBackend,
+                       or the fully qualified name of one, which is imported
+                       on first use.
+    """
+    _backends[name] = backend_class
+    _backend_classes.pop(name, None)
+
+
+def get_backend_class(name):
+    """Return the backend class for a registered name or a dotted path.
+
+    Unregistered names without a '.' are looked up as builtin modules, i.e.
+    'foo' resolves to activity_tracker.backends.foo.FooBackend. Resolved
+    classes are cached, so only the first lookup of a name imports anything.
+    """
+    backend_class = _backend_classes.get(name)
+    if backend_class is None:
+        backend_class = _backends.get(name, name)
+        if isinstance(backend_class, six.string_types):
+            if "." not in backend_class:
+                backend_class = "activity_tracker.backends.{}.{}Backend".format(
+                    backend_class, backend_class.title()
+                )
+            module_name, class_name = backend_class.rsplit(".", 1)
+            module = importlib.import_module(module_name)
+            backend_class = getattr(module, class_name)
+        _backend_classes[name] = backend_class
+    return backend_class
@@ -44,3 +44,10 @@ class BaseBackend(object):
         other arguments.
         """
         raise NotImplementedError()
+
+    def replay_spool(self, **kwargs):
+        """Send any locally spooled activity to the backend.
+
+        Returns the number of spooled records sent.
+        """
+        raise NotImplementedError()
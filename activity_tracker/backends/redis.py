@@ -1,19 +1,42 @@
 from __future__ import absolute_import
 
+import binascii
+from contextlib import contextmanager
 import datetime
 import hashlib
+import itertools
 import logging
-import six
+import os
+import threading
+import time
 
-from redis import StrictRedis
+import six
 
 from .base import BaseBackend
-from ..tracker import ActivityTracker
+from ..periods import PERIOD_DAILY, PERIOD_MONTHLY
 
 log = logging.getLogger(__name__)
 
 __all__ = ["RedisBackend"]
 
+DIMENSION_PREFIX = "dims:"
+
+# The default latency budget, in seconds, for track() when spooling.
+DEFAULT_TRACK_TIMEOUT = 0.1
+
+# The default number of seconds track() spools without trying redis after a
+# failure.
+DEFAULT_TRACK_BACKOFF = 5
+
+# Connection parameters always passed to a custom redis_client, even if None.
+CLIENT_PARAMS = frozenset(["host", "port", "db", "socket_timeout"])
+
+# Connection pools shared between RedisBackend instances (share_pools=True),
+# keyed by their connection parameters. Only valid in the owning process.
+_shared_pools = {}
+_shared_pools_pid = os.getpid()
+_shared_pools_lock = threading.Lock()
+
 
 class RedisBackend(BaseBackend):
     """Redis backend for activity tracker.
@@ -24,6 +47,44 @@ class RedisBackend(BaseBackend):
         collapse() converts them to keys like:
             active:<timeperiod>[:<bucket>] -> count
 
+    Bookkeeping keys:
+        track() registers every bucket it writes to in a per-period index, so
+        collapse() can find all raw sets without a list of buckets and
+        without scanning the keyspace:
+            meta:<timeperiod>:buckets -> set<bucket> ('' for no bucket)
+        collapse() removes the index and marks the period as done:
+            meta:<timeperiod>:collapsed -> 1
+        track() and replay_spool() record periods that were already
+        collapsed when their activity arrived, so the next collapse() adds it
+        to them:
+            meta:late:<period> -> set<timeperiod>
+        collapse(lock_timeout=N) holds a lock while collapsing, renewed until
+        it is done, and only writes counts while it still holds the lock:
+            meta:lock:collapse:<period> -> token
+
+    Dimensions:
+        Instead of a bucket, track() can be given a dict of dimension values,
+        e.g. dimensions={'platform': 'ios', 'plan': 'paid'}, for the
+        dimension names declared in the 'dimensions' keyword argument. Each
+        combination of values is stored as a raw bucket:
+            active:<timeperiod>:raw:dims:<value>[,<value>...] -> set<id>
+        collapse() computes the distinct count for every group of every
+        rollup (a subset of the dimensions) in one pass. Each rollup is built
+        by unioning the groups of a finer rollup, rather than from the raw
+        sets, and stored as a hash:
+            active:<timeperiod>:dims:<name>[,<name>...] ->
+                hash{<value>[,<value>...]: count}
+        The rollup over no dimensions ('dims:*', with a single '' field) is
+        the total. Use lookup(group_by=[...], filter={...}) to read them.
+        Dimension names and values may not be empty or contain ','.
+
+        track() also stores the dimension names for the period, so that any
+        backend can collapse it, even one created without 'dimensions' (it
+        computes every rollup unless its own dimensions match):
+            meta:<timeperiod>:dimensions -> <name>[,<name>...]
+        A period with dimension buckets but no known dimension names is not
+        collapsed.
+
     Sharding:
         All data for a given time period / bucket pair must be stored on the
         same redis server in the same database. If multiple buckets are used
@@ -36,19 +97,86 @@ class RedisBackend(BaseBackend):
         and provide the appropriate shard=N argument to the track/collapse/
         lookup calls.
 
+    Connections:
+        Each shard gets its own redis.ConnectionPool, created on first use
+        and safe to use from multiple threads. If the process forks (e.g.
+        gunicorn or celery workers), the child discards the pools it
+        inherited and opens fresh connections instead of sharing sockets
+        with its parent. With share_pools=True, backends in the same process
+        that use identical connection parameters share one pool.
+        A custom redis_client manages its own connections, but is still
+        created once per shard and recreated after a fork.
+
+    Spooling:
+        If a spool is provided, track() fails open: calls that time out
+        (after track_timeout seconds) or cannot connect are appended to a
+        local activity_tracker.spool.Spool instead of raising. If the spool
+        itself cannot be written, the activity is logged and dropped. A
+        track_timeout of N seconds bounds both connecting and waiting for a
+        reply, so a failing call can take about 2N seconds. After a failure,
+        track() spools calls for that shard without trying redis for
+        track_backoff seconds, so an outage does not slow down every call.
+
+        Call replay_spool() once redis is healthy again to send them, in the
+        periods in which they were originally tracked. If such a period was
+        already collapsed, the next collapse() adds the replayed activity to
+        its counts. Counts for those periods are then approximate: an entity
+        seen both before and after the first collapse is counted twice, and
+        replayed removals (old_id) are not subtracted.
+
     Keyword arguments:
-        host:           Default redis host. Defaults to 'localhost'.
-        port:           Default redis port. Defaults to 6379.
-        db:             Default redis db. Defaults to 0.
-        socket_timeout: Socket timeout in seconds. Defaults to no timeout.
-        shards:         A list of per-shard overrides for the above parameters.
-                        Defaults to [{}], meaning a single shard (0) which uses
-                        the above parameters.
+        host:                   Default redis host. Defaults to 'localhost'.
+        port:                   Default redis port. Defaults to 6379.
+        db:                     Default redis db. Defaults to 0.
+        socket_timeout:         Socket timeout in seconds. Defaults to no
+                                timeout.
+        socket_connect_timeout: Socket connect timeout in seconds. Defaults
+                                to socket_timeout.
+        unix_socket_path:       Connect to this unix socket instead of
+                                host/port. Defaults to None.
+        socket_keepalive:       Enable TCP keepalive. Defaults to None.
+        socket_keepalive_options:
+                                A dict of TCP keepalive socket options.
+                                Defaults to None.
+        max_connections:        Maximum connections per shard pool. Defaults
+                                to no limit.
+        health_check_interval:  Ping connections idle for longer than this
+                                many seconds before reusing them. Defaults to
+                                None (disabled).
+        connection_class:       The redis connection class used for TCP
+                                connections. Defaults to redis.Connection.
+                                Ignored if redis_client is provided.
+        shards:                 A list of per-shard overrides for the above
+                                connection parameters. Defaults to [{}],
+                                meaning a single shard (0) which uses the
+                                above parameters.
+        share_pools:            Share connection pools with other backends in
+                                this process. Defaults to False.
+        spool:                  A Spool, or the path of one, for track() calls
+                                that fail. Defaults to None (failures raise).
+        track_timeout:          Socket and connect timeout in seconds for
+                                track() when a spool is used. Defaults to
+                                0.1.
+        track_backoff:          Seconds to spool track() calls for a shard
+                                without trying redis after a failure.
+                                Defaults to 5.
+        dimensions:             A list of dimension names accepted by track().
+                                Defaults to no dimensions.
+        rollups:                A list of lists of dimension names to compute
+                                counts for in collapse(). Defaults to every
+                                subset of the dimensions.
+        redis_client:           A redis client class to use instead of
+                                redis.StrictRedis with managed pools. It is
+                                constructed with the connection parameters
+                                above as keyword arguments (host, port, db,
+                                socket_timeout, and any others that are set)
+                                and manages its own connections, so it cannot
+                                be combined with share_pools.
     """
 
     PERIOD_FORMATS = {
-        ActivityTracker.PERIOD_DAILY: "daily-{0:%Y%m%d}",
-        ActivityTracker.PERIOD_MONTHLY: "monthly-{0:%Y%m}",
+        PERIOD_DAILY: "daily-{0:%Y%m%d}",
+        PERIOD_MONTHLY: "monthly-{0:%Y%m}",
     }
 
     def __init__(
@@ -59,26 +187,144 @@ class RedisBackend(BaseBackend):
         socket_timeout=None,
         shards=None,
         redis_client=None,
+        socket_connect_timeout=None,
+        unix_socket_path=None,
+        socket_keepalive=None,
+        socket_keepalive_options=None,
+        max_connections=None,
+        health_check_interval=None,
+        connection_class=None,
+        share_pools=False,
+        spool=None,
+        track_timeout=None,
+        dimensions=None,
+        rollups=None,
+        track_backoff=DEFAULT_TRACK_BACKOFF,
     ):
         self.defaults = {
             "host": host,
             "port": port,
             "db": db,
             "socket_timeout": socket_timeout,
+            "socket_connect_timeout": socket_connect_timeout,
+            "unix_socket_path": unix_socket_path,
+            "socket_keepalive": socket_keepalive,
+            "socket_keepalive_options": socket_keepalive_options,
+            "max_connections": max_connections,
+            "health_check_interval": health_check_interval,
+            "connection_class": connection_class,
         }
         self.shards = shards or [{}]
+        if share_pools and redis_client is not None:
+            raise ValueError("Cannot use share_pools with a custom redis_client.")
+        self.share_pools = share_pools
+        if isinstance(spool, six.string_types):
+            from ..spool import Spool
+
+            spool = Spool(spool)
+        self.spool = spool
+        if spool is not None and track_timeout is None:
+            track_timeout = DEFAULT_TRACK_TIMEOUT
+        self.track_timeout = track_timeout
+        self.track_backoff = track_backoff
+        # {shard: time until which track() spools without trying redis}
+        self._spool_until = {}
+
+        self.dimensions = list(dimensions or [])
+        for name in self.dimensions:
+            check_dimension_piece(name)
+        if rollups is None:
+            rollups = all_rollups(self.dimensions)
+        self.rollups = [self._dimension_subset(rollup) for rollup in rollups]
+        # The redis package is imported on first connection; see get_conn().
+        self.redis_client = redis_client
         self.conns = {}
-        self.redis_client = redis_client or StrictRedis
+        self.pools = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
 
-    def get_conn(self, shard):
-        conn = self.conns.get(shard)
+    def get_conn(self, shard, socket_timeout=None):
+        """Return a redis client for a shard.
+
+        If socket_timeout is provided, the client uses a separate pool (or
+        separate redis_client instance) whose socket and connect timeouts are
+        overridden with it.
+        """
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        conn_key = shard if socket_timeout is None else (shard, socket_timeout)
+        conn = self.conns.get(conn_key)
         if conn is None:
-            params = self.defaults.copy()
-            params.update(self.shards[shard])
-            conn = self.redis_client(**params)
-            self.conns[shard] = conn
+            with self._lock:
+                conn = self.conns.get(conn_key)
+                if conn is None:
+                    if self.redis_client is not None:
+                        params = self.get_params(shard, socket_timeout)
+                        params.pop("connection_class")
+                        conn = self.redis_client(
+                            **dict(
+                                (key, value)
+                                for key, value in six.iteritems(params)
+                                if value is not None or key in CLIENT_PARAMS
+                            )
+                        )
+                    else:
+                        from redis import StrictRedis
+
+                        pool = self.get_pool(shard, socket_timeout)
+                        conn = StrictRedis(connection_pool=pool)
+                    self.conns[conn_key] = conn
         return conn
 
+    def get_pool(self, shard, socket_timeout=None):
+        """Return the connection pool for a shard, creating it if needed.
+
+        Must be called with self._lock held.
+        """
+        pool_key = shard if socket_timeout is None else (shard, socket_timeout)
+        pool = self.pools.get(pool_key)
+        if pool is None:
+            params = self.get_params(shard, socket_timeout)
+            if self.share_pools:
+                pool = get_shared_pool(params)
+            else:
+                pool = make_pool(params)
+            self.pools[pool_key] = pool
+        return pool
+
+    def get_params(self, shard, socket_timeout=None):
+        """Return the connection parameters for a shard."""
+        params = self.defaults.copy()
+        params.update(self.shards[shard])
+        if socket_timeout is not None:
+            params["socket_timeout"] = socket_timeout
+            params["socket_connect_timeout"] = socket_timeout
+        return params
+
+    def disconnect(self):
+        """Close all connections in this backend's pools.
+
+        Shared pools are left alone, since other backends may be using them.
+        """
+        with self._lock:
+            if self.redis_client is not None:
+                for conn in six.itervalues(self.conns):
+                    conn.connection_pool.disconnect()
+            elif not self.share_pools:
+                for pool in six.itervalues(self.pools):
+                    pool.disconnect()
+            self.conns = {}
+            self.pools = {}
+
+    def _reset_after_fork(self):
+        # The inherited lock may have been held by another thread at fork
+        # time, and the inherited sockets belong to the parent process, so
+        # replace everything without closing the parent's connections.
+        self._lock = threading.Lock()
+        self.conns = {}
+        self.pools = {}
+        self._pid = os.getpid()
+
     def track(
         self,
         period,
@@ -88,31 +334,161 @@ class RedisBackend(BaseBackend):
         old_bucket=None,
         date=None,
         shard=0,
+        dimensions=None,
+        old_dimensions=None,
     ):
         """Record activity by a specified entity.
 
         Redis-specific keyword arguments:
-            shard: The shard for this dataset. See class docs for details.
+            shard:          The shard for this dataset. See class docs for
+                            details.
+            dimensions:     A dict with a value for every declared dimension,
+                            used instead of bucket. See class docs for
+                            details.
+            old_dimensions: Like dimensions, used instead of old_bucket.
 
         See activity_tracker.tracker.ActivityTracker for descriptions of the
         other arguments.
         """
-        conn = self.get_conn(shard)
+        if dimensions is not None:
+            if bucket is not None:
+                raise ValueError("Cannot pass both bucket and dimensions.")
+            bucket = self.dimension_bucket(dimensions)
+        if old_dimensions is not None:
+            if old_bucket is not None:
+                raise ValueError("Cannot pass both old_bucket and old_dimensions.")
+            old_bucket = self.dimension_bucket(old_dimensions)
+
+        if id is None and old_id is None:
+            return
         if date is None:
             date = datetime.date.today()
         period_str = self.PERIOD_FORMATS[period].format(date)
-        add_key = make_key("active", period_str, "raw", bucket)
-        old_key = make_key("active", period_str, "raw", old_bucket)
+        schema = self.dimensions if dimensions is not None else None
 
-        if id is not None and old_id is not None:
+        if self.spool is not None and time.time() < self._spool_until.get(shard, 0):
+            self._spool_track(
+                period, date, id, bucket, old_id, old_bucket, shard, schema
+            )
+            return
+
+        socket_timeout = self.track_timeout if self.spool is not None else None
+        try:
+            conn = self.get_conn(shard, socket_timeout=socket_timeout)
             with conn.pipeline() as pipe:
-                pipe.sadd(add_key, str(id))
-                pipe.srem(old_key, str(old_id))
-                pipe.execute()
-        elif id is not None:
-            conn.sadd(add_key, str(id))
-        elif old_id is not None:
-            conn.srem(old_key, str(old_id))
+                queue_track(
+                    pipe,
+                    period_str,
+                    id,
+                    bucket,
+                    old_id,
+                    old_bucket,
+                    dimensions=schema,
+                )
+                if id is not None:
+                    pipe.exists(make_done_key(period_str))
+                results = pipe.execute()
+            if id is not None and results[-1]:
+                # The period was already collapsed; have the next collapse()
+                # add this activity to its counts.
+                conn.sadd(make_late_key(period), period_str)
+        except spoolable_errors() as e:
+            if self.spool is None:
+                raise
+            log.warning(
+                "Spooling activity for shard %r for %s seconds: %s",
+                shard,
+                self.track_backoff,
+                e,
+            )
+            self._spool_until[shard] = time.time() + self.track_backoff
+            self._spool_track(
+                period, date, id, bucket, old_id, old_bucket, shard, schema
+            )
+
+    def _spool_track(
+        self, period, date, id, bucket, old_id, old_bucket, shard, dimensions
+    ):
+        try:
+            self.spool.append(
+                {
+                    "period": period,
+                    "date": "{0:%Y-%m-%d}".format(date),
+                    "id": str(id) if id is not None else None,
+                    "bucket": bucket,
+                    "old_id": str(old_id) if old_id is not None else None,
+                    "old_bucket": old_bucket,
+                    "shard": shard,
+                    "dimensions": dimensions,
+                }
+            )
+        except (IOError, OSError):
+            log.exception(
+                "Dropping activity for %r on shard %r; cannot write to spool",
+                period,
+                shard,
+            )
+
+    def replay_spool(self, batch_size=500):
+        """Send spooled track() calls to redis.
+
+        Each batch of spooled calls is sent in one pipeline per shard.
+        Returns the number of calls replayed.
+        """
+        if self.spool is None:
+            return 0
+        return self.spool.replay(self._replay_batch, batch_size=batch_size)
+
+    def _replay_batch(self, records):
+        pipes = {}
+        added = set()
+        for record in records:
+            shard = record["shard"]
+            pipe = pipes.get(shard)
+            if pipe is None:
+                pipe = pipes[shard] = self.get_conn(shard).pipeline(transaction=False)
+            date = datetime.datetime.strptime(record["date"], "%Y-%m-%d").date()
+            period_str = self.PERIOD_FORMATS[record["period"]].format(date)
+            if record["id"] is not None:
+                added.add((shard, record["period"], period_str))
+            queue_track(
+                pipe,
+                period_str,
+                record["id"],
+                record["bucket"],
+                record["old_id"],
+                record["old_bucket"],
+                dimensions=record.get("dimensions"),
+            )
+        for pipe in six.itervalues(pipes):
+            pipe.execute()
+
+        # Checked after writing, so a collapse that raced with this batch has
+        # either counted the new data or left its period to be marked here.
+        for shard, period, period_str in sorted(added):
+            conn = self.get_conn(shard)
+            if conn.exists(make_done_key(period_str)):
+                conn.sadd(make_late_key(period), period_str)
+
+    def dimension_bucket(self, dimensions):
+        """Return the raw bucket name for a dict of dimension values."""
+        if set(dimensions) != set(self.dimensions):
+            raise ValueError(
+                "Expected values for dimensions {!r}, got {!r}".format(
+                    self.dimensions, sorted(dimensions)
+                )
+            )
+        values = [str(dimensions[name]) for name in self.dimensions]
+        for value in values:
+            check_dimension_piece(value)
+        return DIMENSION_PREFIX + ",".join(values)
+
+    def _dimension_subset(self, names):
+        """Return names as a tuple in declared dimension order."""
+        unknown = set(names) - set(self.dimensions)
+        if unknown:
+            raise ValueError("Unknown dimensions {!r}".format(sorted(unknown)))
+        return tuple(name for name in self.dimensions if name in names)
 
     def collapse(
         self,
@@ -122,11 +498,22 @@ class RedisBackend(BaseBackend):
         buckets=None,
         aggregate_buckets=None,
         shard=0,
+        lock_timeout=None,
     ):
         """Collapse raw data into aggregate counts.
 
+        Every bucket registered by track() for a period is collapsed, in
+        addition to any buckets passed explicitly. Activity replayed into
+        periods that were already collapsed is added to their counts.
+
         Redis-specific keyword arguments:
-            shard: The shard for this dataset. See class docs for details.
+            shard:        The shard for this dataset. See class docs for
+                          details.
+            lock_timeout: If provided, hold a lock (expiring after this many
+                          seconds, and renewed while collapsing) on the
+                          period type, and do nothing if another process
+                          already holds it. Counts are only written while
+                          the lock is still held.
 
         See activity_tracker.tracker.ActivityTracker for descriptions of the
         other arguments.
@@ -135,29 +522,160 @@ class RedisBackend(BaseBackend):
         if date is None:
             date = datetime.date.today()
 
-        sentinel = object()
-        test_bucket = list(buckets or aggregate_buckets or [sentinel])[0]
-        if test_bucket is sentinel:
-            return
+        if lock_timeout is not None:
+            lock_key = make_key("meta", "lock", "collapse", period)
+            with redis_lock(conn, lock_key, lock_timeout) as token:
+                if token is None:
+                    log.info(
+                        "Skipping %r collapse on shard %r; lock is held elsewhere",
+                        period,
+                        shard,
+                    )
+                    return
+                try:
+                    self._collapse(
+                        conn,
+                        period,
+                        date,
+                        max_periods,
+                        buckets,
+                        aggregate_buckets,
+                        lock=(lock_key, token),
+                    )
+                except LockLostError:
+                    log.warning(
+                        "Abandoning %r collapse on shard %r; lock was lost",
+                        period,
+                        shard,
+                    )
+        else:
+            self._collapse(conn, period, date, max_periods, buckets, aggregate_buckets)
+
+    def _collapse(
+        self, conn, period, date, max_periods, buckets, aggregate_buckets, lock=None
+    ):
+        # Periods collapsed before the done marker existed only have counts.
+        known_buckets = list(buckets or []) + list(aggregate_buckets or [])
 
         queue = []
+        last_done = None
         period_fmt = self.PERIOD_FORMATS[period]
         for period_dt, period_str in iter_period_reverse(date, period_fmt):
-            if conn.exists(make_key("active", period_str, test_bucket)):
+            done_keys = [make_done_key(period_str)]
+            done_keys.extend(
+                make_key("active", period_str, bucket) for bucket in known_buckets
+            )
+            if conn.exists(*done_keys):
+                last_done = period_str
                 break
             queue.insert(0, period_str)
             if len(queue) >= max_periods:
                 break
 
         for period_str in queue:
-            self.collapse_single(
-                buckets or [], aggregate_buckets or {}, conn, period_str
+            self._collapse_period(
+                conn, period_str, buckets, aggregate_buckets, lock=lock
             )
 
-    def collapse_single(self, buckets, aggregate_buckets, conn, period_str):
+        late_key = make_late_key(period)
+        late = set(
+            six.ensure_text(period_str) for period_str in conn.smembers(late_key)
+        )
+        # Also catch activity that reached a collapsed period without being
+        # recorded as late, e.g. if track() failed before marking it.
+        if last_done is not None and conn.exists(make_index_key(last_done)):
+            late.add(last_done)
+        for period_str in sorted(late):
+            if self._collapse_period(
+                conn, period_str, buckets, aggregate_buckets, increment=True, lock=lock
+            ):
+                conn.srem(late_key, period_str)
+
+    def _collapse_period(
+        self, conn, period_str, buckets, aggregate_buckets, increment=False, lock=None
+    ):
+        """Collapse one period, returning False if it could not be collapsed."""
+        period_buckets = [bucket or "" for bucket in buckets or []]
+        registered = conn.smembers(make_index_key(period_str))
+        period_buckets.extend(
+            sorted(
+                set(six.ensure_text(bucket) for bucket in registered)
+                - set(period_buckets)
+            )
+        )
+        dimension_buckets = [
+            bucket for bucket in period_buckets if bucket.startswith(DIMENSION_PREFIX)
+        ]
+        period_buckets = [
+            bucket
+            for bucket in period_buckets
+            if not bucket.startswith(DIMENSION_PREFIX)
+        ]
+
+        dimensions = self.dimensions
+        stored = conn.get(make_schema_key(period_str))
+        if stored is not None:
+            dimensions = six.ensure_text(stored).split(",")
+        if dimension_buckets and not dimensions:
+            log.error(
+                "Not collapsing %r; it has dimension buckets but no dimensions",
+                period_str,
+            )
+            return False
+        if dimensions == self.dimensions:
+            rollups = self.rollups
+        else:
+            rollups = all_rollups(dimensions)
+
+        self.collapse_single(
+            period_buckets,
+            aggregate_buckets or {},
+            conn,
+            period_str,
+            dimension_buckets=dimension_buckets,
+            increment=increment,
+            dimensions=dimensions,
+            rollups=rollups,
+            lock=lock,
+        )
+        return True
+
+    def collapse_single(
+        self,
+        buckets,
+        aggregate_buckets,
+        conn,
+        period_str,
+        dimension_buckets=(),
+        increment=False,
+        dimensions=None,
+        rollups=None,
+        lock=None,
+    ):
+        """Collapse the raw data for one period.
+
+        If increment is True, the counts are added to the period's existing
+        counts instead of replacing them. dimensions and rollups default to
+        the backend's own. If lock is a (key, token) pair, the counts are only
+        written if the lock key still holds token; otherwise LockLostError is
+        raised and the raw data is left in place.
+        """
         log.info("Collapsing activity data for time period %r", period_str)
+        if dimensions is None:
+            dimensions, rollups = self.dimensions, self.rollups
         to_set = {}
-        to_remove = set()
+        to_hset = {}
+        to_remove = set([make_index_key(period_str), make_schema_key(period_str)])
+        if dimensions:
+            self.collapse_dimensions(
+                dimension_buckets,
+                conn,
+                period_str,
+                to_hset,
+                to_remove,
+                dimensions,
+                rollups,
+            )
         for bucket in buckets:
             in_key = make_key("active", period_str, "raw", bucket)
             out_key = make_key("active", period_str, bucket)
@@ -186,18 +704,115 @@ class RedisBackend(BaseBackend):
                 conn.delete(temp_key)
             to_remove.update(in_keys)
 
-        with conn.pipeline() as pipe:
+        def write(pipe):
+            pipe.set(make_done_key(period_str), 1)
             for key, value in six.iteritems(to_set):
-                pipe.set(key, value)
+                if increment:
+                    pipe.incrby(key, value)
+                else:
+                    pipe.set(key, value)
+            for key, mapping in six.iteritems(to_hset):
+                if increment:
+                    for field, value in six.iteritems(mapping):
+                        pipe.hincrby(key, field, value)
+                    continue
+                pipe.delete(key)
+                if mapping:
+                    pipe.hset(key, mapping=mapping)
             for key in to_remove:
                 pipe.delete(key)
-            pipe.execute()
 
-    def lookup(self, period, start=None, end=None, buckets=None, shard=0):
+        if lock is None:
+            with conn.pipeline() as pipe:
+                write(pipe)
+                pipe.execute()
+        elif not locked_transaction(conn, lock[0], lock[1], write):
+            raise LockLostError(lock[0])
+
+    def collapse_dimensions(
+        self, buckets, conn, period_str, to_hset, to_remove, dimensions, rollups
+    ):
+        """Compute the counts for every rollup of the dimension buckets.
+
+        Rollups are computed from the finest to the coarsest. Each group of a
+        rollup is the union of the matching groups of the smallest already
+        computed finer rollup, so raw sets are only read for the rollups
+        directly below the full set of dimensions. Groups made of a single
+        set reuse that set instead of copying it.
+        """
+        full = tuple(dimensions)
+        # {subset: {group values: set key}}
+        computed = {full: {}}
+        for bucket in buckets:
+            values = tuple(bucket[len(DIMENSION_PREFIX) :].split(","))
+            if len(values) != len(full):
+                log.warning("Skipping unknown dimension bucket %r", bucket)
+                continue
+            in_key = make_key("active", period_str, "raw", bucket)
+            computed[full][values] = in_key
+            to_remove.add(in_key)
+
+        for subset in sorted(set(rollups), key=len, reverse=True):
+            if subset in computed:
+                parent = subset
+            else:
+                parent = min(
+                    (
+                        candidate
+                        for candidate in computed
+                        if set(subset) < set(candidate)
+                    ),
+                    key=lambda candidate: len(computed[candidate]),
+                )
+            indexes = [parent.index(name) for name in subset]
+            sources = {}
+            for values, key in six.iteritems(computed[parent]):
+                group = tuple(values[i] for i in indexes)
+                sources.setdefault(group, []).append(key)
+
+            groups = sorted(sources)
+            group_keys = {}
+            with conn.pipeline(transaction=False) as pipe:
+                for group in groups:
+                    in_keys = sources[group]
+                    if len(in_keys) == 1:
+                        group_keys[group] = in_keys[0]
+                        pipe.scard(in_keys[0])
+                    else:
+                        # Names and values cannot contain ',', and a group has
+                        # one value per name, so this is unambiguous.
+                        temp_key = make_temp_key(
+                            "dims", [",".join((period_str,) + subset + group)]
+                        )
+                        group_keys[group] = temp_key
+                        to_remove.add(temp_key)
+                        pipe.sunionstore(temp_key, *in_keys)
+                counts = pipe.execute()
+
+            computed[subset] = group_keys
+            to_hset[make_dimension_key(period_str, subset)] = dict(
+                (",".join(group), count) for group, count in zip(groups, counts)
+            )
+
+    def lookup(
+        self,
+        period,
+        start=None,
+        end=None,
+        buckets=None,
+        shard=0,
+        group_by=None,
+        filter=None,
+    ):
         """Lookup data for a time range.
 
         Redis-specific keyword arguments:
-            shard: The shard for this dataset. See class docs for details.
+            shard:    The shard for this dataset. See class docs for details.
+            group_by: A list of dimension names. If provided (or if filter is
+                      provided), dimension counts are returned instead of
+                      bucket counts, keyed by tuples of the group_by values.
+            filter:   A dict of {dimension: value} that counted groups must
+                      match.
 
         See activity_tracker.tracker.ActivityTracker for descriptions of the
         other arguments.
@@ -208,17 +823,17 @@ class RedisBackend(BaseBackend):
         if start is None:
             start = end - datetime.timedelta(days=365)
 
-        period_fmt = self.PERIOD_FORMATS[period]
+        if group_by is not None or filter is not None:
+            return self._lookup_dimensions(
+                conn, period, start, end, group_by or [], filter or {}
+            )
+
         result = []
         keys = []
         result_map = []
-        for period_dt, period_str in iter_period_reverse(end, period_fmt):
-            if period == ActivityTracker.PERIOD_MONTHLY:
-                period_dt = period_dt.replace(day=1)
-            if period_dt < start:
-                break
+        for period_dt, period_str in self._iter_lookup_periods(period, start, end):
             period_result = {}
-            result.insert(0, (period_dt, period_result))
+            result.append((period_dt, period_result))
             for bucket in buckets or [None]:
                 keys.append(make_key("active", period_str, bucket))
                 result_map.append((period_result, bucket))
@@ -229,13 +844,147 @@ class RedisBackend(BaseBackend):
             period_result[bucket] = int(value) if value is not None else 0
         return result
 
+    def _lookup_dimensions(self, conn, period, start, end, group_by, filter):
+        subset = self._dimension_subset(list(group_by) + list(filter))
+        if subset not in self.rollups:
+            raise ValueError("Dimensions {!r} are not a rollup".format(subset))
+        filter = dict((name, str(value)) for name, value in six.iteritems(filter))
+
+        periods = self._iter_lookup_periods(period, start, end)
+        with conn.pipeline(transaction=False) as pipe:
+            for period_dt, period_str in periods:
+                pipe.hgetall(make_dimension_key(period_str, subset))
+            hashes = pipe.execute()
+
+        result = []
+        for (period_dt, period_str), counts in six.moves.zip(periods, hashes):
+            period_result = {}
+            for field, count in six.iteritems(counts):
+                field = six.ensure_text(field)
+                values = dict(zip(subset, field.split(",") if subset else []))
+                if all(values[name] == value for name, value in six.iteritems(filter)):
+                    group = tuple(values[name] for name in group_by)
+                    period_result[group] = int(count)
+            result.append((period_dt, period_result))
+        return result
+
+    def _iter_lookup_periods(self, period, start, end):
+        """Return (date, period_str) for each period in [start, end)."""
+        period_fmt = self.PERIOD_FORMATS[period]
+        periods = []
+        for period_dt, period_str in iter_period_reverse(end, period_fmt):
+            if period == PERIOD_MONTHLY:
+                period_dt = period_dt.replace(day=1)
+            if period_dt < start:
+                break
+            periods.insert(0, (period_dt, period_str))
+        return periods
+
+
+class LockLostError(Exception):
+    """Raised when a collapse lock expired or was taken before writing."""
+
+
+def make_pool(params):
+    """Create a redis connection pool from RedisBackend connection params."""
+    from redis import ConnectionPool, UnixDomainSocketConnection
+
+    params = dict(
+        (key, value) for key, value in six.iteritems(params) if value is not None
+    )
+    if "unix_socket_path" in params:
+        params["path"] = params.pop("unix_socket_path")
+        params["connection_class"] = UnixDomainSocketConnection
+        for key in ("host", "port", "socket_keepalive", "socket_keepalive_options"):
+            params.pop(key, None)
+    return ConnectionPool(**params)
+
+
+def get_shared_pool(params):
+    """Return the process-wide connection pool for these params."""
+    global _shared_pools, _shared_pools_lock, _shared_pools_pid
+    pool_key = repr(sorted(six.iteritems(params), key=lambda item: item[0]))
+    if _shared_pools_pid != os.getpid():
+        # Like RedisBackend._reset_after_fork(), replace the inherited lock
+        # before taking it, since another thread may have held it at fork time.
+        _shared_pools_lock = threading.Lock()
+        _shared_pools = {}
+        _shared_pools_pid = os.getpid()
+    with _shared_pools_lock:
+        pool = _shared_pools.get(pool_key)
+        if pool is None:
+            pool = _shared_pools[pool_key] = make_pool(params)
+    return pool
+
+
+def spoolable_errors():
+    """Return the redis errors that cause track() to spool.
+
+    Used in except clauses, which only evaluate this once something has
+    failed, so redis is still imported lazily.
+    """
+    from redis.exceptions import ConnectionError, TimeoutError
+
+    return (ConnectionError, TimeoutError)
+
+
+def queue_track(
+    pipe, period_str, id, bucket, old_id, old_bucket, dimensions=None
+):
+    """Add the commands for a single track() call to a pipeline.
+
+    dimensions is the list of dimension names if bucket is a dimension
+    bucket.
+    """
+    if id is not None:
+        pipe.sadd(make_key("active", period_str, "raw", bucket), str(id))
+        pipe.sadd(make_index_key(period_str), bucket or "")
+        if dimensions:
+            pipe.set(make_schema_key(period_str), ",".join(dimensions))
+    if old_id is not None:
+        pipe.srem(make_key("active", period_str, "raw", old_bucket), str(old_id))
+
+
+def make_dimension_key(period_str, subset):
+    return make_key("active", period_str, "dims", ",".join(subset) or "*")
+
+
+def check_dimension_piece(piece):
+    if not piece or "," in piece:
+        raise ValueError("Invalid dimension name or value {!r}".format(piece))
+
 
 def make_key(*pieces):
     return ":".join(piece for piece in pieces if piece)
 
 
+def make_index_key(period_str):
+    return make_key("meta", period_str, "buckets")
+
+
+def make_schema_key(period_str):
+    return make_key("meta", period_str, "dimensions")
+
+
+def all_rollups(dimensions):
+    """Return every subset of dimensions, as tuples in declared order."""
+    return [
+        subset
+        for size in range(len(dimensions) + 1)
+        for subset in itertools.combinations(dimensions, size)
+    ]
+
+
+def make_done_key(period_str):
+    return make_key("meta", period_str, "collapsed")
+
+
+def make_late_key(period):
+    return make_key("meta", "late", period)
+
+
 def make_temp_key(temp_type, pieces):
-    md5 = hashlib.md5(six.b(" ".join(pieces))).hexdigest()
+    md5 = hashlib.md5(six.ensure_binary(" ".join(pieces))).hexdigest()
     return make_key("temp", temp_type, md5)
 
 
@@ -248,3 +997,70 @@ def iter_period_reverse(start, fmt):
         if dt_str != last_dt_str:
             yield dt, dt_str
             last_dt_str = dt_str
+
+
+@contextmanager
+def redis_lock(conn, key, timeout):
+    """Try to take an expiring lock, yielding its token or None.
+
+    While held, the lock is renewed every timeout / 3 seconds by a background
+    thread, so it only expires if this process stops renewing it. Use
+    locked_transaction() to only write while still holding it. The lock is
+    only released if it is still held by this caller.
+    """
+    token = binascii.hexlify(os.urandom(16)).decode("ascii")
+    timeout_ms = max(1, int(timeout * 1000))
+    if not conn.set(key, token, nx=True, px=timeout_ms):
+        yield None
+        return
+
+    stop = threading.Event()
+    renewer = threading.Thread(
+        target=renew_lock, args=(conn, key, token, timeout_ms, stop)
+    )
+    renewer.daemon = True
+    renewer.start()
+    try:
+        yield token
+    finally:
+        stop.set()
+        renewer.join()
+        locked_transaction(conn, key, token, lambda pipe: pipe.delete(key))
+
+
+def renew_lock(conn, key, token, timeout_ms, stop):
+    """Reset the expiry of a redis_lock() until stop is set or it is lost."""
+    while not stop.wait(timeout_ms / 3000.0):
+        try:
+            renewed = locked_transaction(
+                conn, key, token, lambda pipe: pipe.pexpire(key, timeout_ms)
+            )
+        except Exception:
+            log.exception("Failed to renew lock %r", key)
+            continue
+        if not renewed:
+            log.warning("Lost lock %r", key)
+            return
+
+
+def locked_transaction(conn, key, token, func):
+    """Run the commands queued by func(pipe) if key still holds token.
+
+    The commands are sent in a MULTI/EXEC block that is retried if key
+    changes (e.g. its expiry is renewed) in the meantime. Returns whether
+    they were run.
+    """
+    from redis import WatchError
+
+    with conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                if six.ensure_text(pipe.get(key) or b"") != token:
+                    return False
+                pipe.multi()
+                func(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
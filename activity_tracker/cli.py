@@ -0,0 +1,221 @@
+from __future__ import absolute_import
+
+import argparse
+import datetime
+import json
+import logging
+import time
+
+from .tracker import ActivityTracker
+
+log = logging.getLogger(__name__)
+
+__all__ = ["main"]
+
+
+def next_period_boundary(now):
+    """Return the datetime at which the next period starts.
+
+    Every supported period (daily, monthly) starts at midnight, so this is
+    always the next local midnight after now.
+    """
+    tomorrow = now.date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time())
+
+
+def run_collapse_daemon(
+    tracker,
+    num_shards=1,
+    max_periods=1,
+    aggregate_buckets=None,
+    lock_timeout=600,
+    delay=60,
+    once=False,
+    replay_spool=False,
+    late_interval=3600,
+):
+    """Collapse all registered buckets for every shard, once per period.
+
+    A collapse pass runs immediately (to catch up on any missed periods),
+    shortly after each period boundary, and every late_interval seconds in
+    between to count activity replayed into already collapsed periods (see
+    RedisBackend.replay_spool()). Each pass takes a per-shard lock
+    in the backend, so several daemons can safely run side by side.
+
+    Arguments:
+        tracker:           The ActivityTracker whose data should be collapsed.
+        num_shards:        The number of backend shards to collapse.
+        max_periods:       Passed to collapse().
+        aggregate_buckets: Passed to collapse().
+        lock_timeout:      Seconds after which the collapse lock of a daemon
+                           that stopped renewing it expires.
+        delay:             Seconds to wait after a period boundary before
+                           collapsing, to let late track() calls land.
+        once:              Run a single pass and return.
+        replay_spool:      Replay the tracker's spool before each pass, so
+                           spooled activity is counted in its period.
+        late_interval:     The maximum number of seconds between passes.
+    """
+    while True:
+        if replay_spool:
+            try:
+                tracker.replay_spool()
+            except Exception:
+                log.exception("Failed to replay spooled activity")
+        for shard in range(num_shards):
+            try:
+                tracker.collapse(
+                    max_periods=max_periods,
+                    aggregate_buckets=aggregate_buckets,
+                    shard=shard,
+                    lock_timeout=lock_timeout,
+                )
+            except Exception:
+                log.exception("Failed to collapse activity data on shard %r", shard)
+        if once:
+            return
+
+        now = datetime.datetime.now()
+        wake = min(
+            next_period_boundary(now) + datetime.timedelta(seconds=delay),
+            now + datetime.timedelta(seconds=late_interval),
+        )
+        sleep_seconds = (wake - now).total_seconds()
+        log.info("Next collapse at %s", wake)
+        time.sleep(sleep_seconds)
+
+
+def parse_aggregate(value):
+    """Parse a NAME=BUCKET[,BUCKET...] command line argument."""
+    name, sep, sources = value.partition("=")
+    if not sep or not name or not sources:
+        raise argparse.ArgumentTypeError(
+            "Expected NAME=BUCKET[,BUCKET...], got {!r}".format(value)
+        )
+    return name, sources.split(",")
+
+
+def build_parser():
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument("--backend", default="redis")
+    connection.add_argument("--host", default="localhost")
+    connection.add_argument("--port", type=int, default=6379)
+    connection.add_argument("--db", type=int, default=0)
+    connection.add_argument(
+        "--shard",
+        dest="shards",
+        action="append",
+        type=json.loads,
+        help="JSON object of per-shard overrides, e.g. '{\"db\": 1}'; may be "
+        "repeated. Defaults to a single shard.",
+    )
+    connection.add_argument(
+        "--spool-path", help="The path of the spool used by track() calls."
+    )
+
+    parser = argparse.ArgumentParser(prog="activity-tracker")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    daemon = subparsers.add_parser(
+        "collapse-daemon",
+        parents=[connection],
+        help="Collapse all registered buckets at every period boundary.",
+    )
+    daemon.add_argument(
+        "--period",
+        dest="periods",
+        action="append",
+        choices=[ActivityTracker.PERIOD_DAILY, ActivityTracker.PERIOD_MONTHLY],
+        help="A period to collapse; may be repeated. Defaults to all periods.",
+    )
+    daemon.add_argument(
+        "--aggregate",
+        dest="aggregate_buckets",
+        action="append",
+        type=parse_aggregate,
+        metavar="NAME=BUCKET[,BUCKET...]",
+        help="An aggregate bucket to compute; may be repeated.",
+    )
+    daemon.add_argument(
+        "--dimension",
+        dest="dimensions",
+        action="append",
+        help="A dimension name accepted by track(); may be repeated.",
+    )
+    daemon.add_argument(
+        "--rollup",
+        dest="rollups",
+        action="append",
+        type=lambda value: [name for name in value.split(",") if name],
+        metavar="NAME[,NAME...]",
+        help="Dimensions to compute grouped counts for; may be repeated. "
+        "Defaults to every combination of the dimensions.",
+    )
+    daemon.add_argument("--max-periods", type=int, default=1)
+    daemon.add_argument("--lock-timeout", type=float, default=600)
+    daemon.add_argument("--delay", type=int, default=60)
+    daemon.add_argument("--late-interval", type=int, default=3600)
+    daemon.add_argument("--once", action="store_true")
+
+    replay = subparsers.add_parser(
+        "replay-spool",
+        parents=[connection],
+        help="Send activity spooled while the backend was unavailable.",
+    )
+    replay.add_argument("--batch-size", type=int, default=500)
+    return parser
+
+
+def make_tracker(args, periods=None):
+    kwargs = {}
+    if args.spool_path:
+        kwargs["spool"] = args.spool_path
+    if getattr(args, "dimensions", None):
+        kwargs["dimensions"] = args.dimensions
+    if getattr(args, "rollups", None):
+        kwargs["rollups"] = args.rollups
+    return ActivityTracker(
+        periods=periods,
+        backend=args.backend,
+        host=args.host,
+        port=args.port,
+        db=args.db,
+        shards=args.shards or [{}],
+        **kwargs
+    )
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s"
+    )
+
+    if args.command == "collapse-daemon":
+        tracker = make_tracker(
+            args,
+            periods=args.periods
+            or [ActivityTracker.PERIOD_DAILY, ActivityTracker.PERIOD_MONTHLY],
+        )
+        run_collapse_daemon(
+            tracker,
+            num_shards=len(args.shards or [{}]),
+            max_periods=args.max_periods,
+            aggregate_buckets=dict(args.aggregate_buckets or []),
+            lock_timeout=args.lock_timeout,
+            delay=args.delay,
+            once=args.once,
+            replay_spool=bool(args.spool_path),
+            late_interval=args.late_interval,
+        )
+    elif args.command == "replay-spool":
+        if not args.spool_path:
+            parser.error("replay-spool requires --spool-path")
+        count = make_tracker(args).replay_spool(batch_size=args.batch_size)
+        log.info("Replayed %d spooled activity records", count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""Period constants shared by the tracker and its backends.
+
+These are also available as attributes of
+activity_tracker.tracker.ActivityTracker.
+"""
+
+__all__ = ["PERIOD_DAILY", "PERIOD_MONTHLY"]
+
+PERIOD_DAILY = "daily"
+PERIOD_MONTHLY = "monthly"
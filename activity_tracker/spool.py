@@ -0,0 +1,232 @@
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+__all__ = ["Spool"]
+
+
+class Spool(object):
+    """A local, append-only file of records waiting to be sent to a backend.
+
+    Records are JSON objects written one per line. Several threads and
+    processes may append to the same spool path; on platforms with fcntl,
+    writers and the replayer coordinate with flock() so no record is lost
+    while a file is being rotated or replayed.
+
+    Files are rotated once they reach max_bytes, by renaming them to
+    <path>.<timestamp>.<pid>. At most backup_count rotated files are kept;
+    when that is exceeded the oldest is deleted (and its records dropped), so
+    the spool never uses much more than max_bytes * (backup_count + 1) bytes.
+
+    Keyword arguments:
+        path:           The path of the live spool file.
+        max_bytes:      Rotate the live file once it reaches this size.
+                        Defaults to 64MB.
+        backup_count:   The maximum number of rotated files to keep.
+                        Defaults to 10.
+        fsync_every:    fsync() after this many appends. Defaults to 100.
+        fsync_interval: fsync() on append if this many seconds have passed
+                        since the last fsync(). Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=64 * 1024 * 1024,
+        backup_count=10,
+        fsync_every=100,
+        fsync_interval=1.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = os.getpid()
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def append(self, record):
+        """Append a JSON-serializable record to the spool."""
+        line = (json.dumps(record, sort_keys=True) + "\n").encode("utf-8")
+        self._check_fork()
+        with self._lock:
+            fd = self._open()
+            _flock(fd)
+            try:
+                fd = self._check_rotated(fd)
+                os.write(fd, line)
+                self._unsynced += 1
+                now = time.time()
+                if (
+                    self._unsynced >= self.fsync_every
+                    or now - self._last_sync >= self.fsync_interval
+                ):
+                    self._sync(fd, now)
+                if os.fstat(fd).st_size >= self.max_bytes:
+                    self._rotate(fd)
+            finally:
+                _funlock(fd)
+
+    def flush(self):
+        """fsync() any appended records that have not been synced yet."""
+        self._check_fork()
+        with self._lock:
+            if self._fd is not None:
+                self._sync(self._fd, time.time())
+
+    def close(self):
+        self._check_fork()
+        with self._lock:
+            if self._fd is not None:
+                self._sync(self._fd, time.time())
+                os.close(self._fd)
+            self._fd = None
+
+    def replay(self, callback, batch_size=500):
+        """Send all spooled records to callback, oldest first.
+
+        The live file is rotated first, so records appended while replaying
+        are left for the next replay. callback is called with lists of at most
+        batch_size records. Each file is deleted once all of its records were
+        handled; if callback raises, the remaining files are kept and the
+        exception propagates. Records in a partially replayed file will be
+        replayed again, so callback should be idempotent.
+
+        Returns the number of records replayed.
+        """
+        self._check_fork()
+        if os.path.exists(self.path):
+            with self._lock:
+                fd = self._open()
+                _flock(fd)
+                try:
+                    fd = self._check_rotated(fd)
+                    if os.fstat(fd).st_size:
+                        self._rotate(fd)
+                finally:
+                    _funlock(fd)
+
+        count = 0
+        for path in self.rotated_paths():
+            with open(path, "rb") as f:
+                # Wait for any writer still holding the file from before it
+                # was rotated.
+                _flock(f.fileno())
+                _funlock(f.fileno())
+                batch = []
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        batch.append(json.loads(line.decode("utf-8")))
+                    except ValueError:
+                        log.warning("Skipping corrupt spool record in %s", path)
+                        continue
+                    if len(batch) >= batch_size:
+                        callback(batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    callback(batch)
+                    count += len(batch)
+            os.remove(path)
+        return count
+
+    def rotated_paths(self):
+        """Return the paths of all rotated spool files, oldest first."""
+        dirname, basename = os.path.split(self.path)
+        prefix = basename + "."
+        paths = []
+        for name in os.listdir(dirname or "."):
+            if not name.startswith(prefix):
+                continue
+            timestamp, sep, pid = name[len(prefix) :].partition(".")
+            if sep and timestamp.isdigit() and pid.isdigit():
+                paths.append(os.path.join(dirname, name))
+        return sorted(paths)
+
+    def _check_fork(self):
+        # Like RedisBackend._reset_after_fork(): the inherited lock may have
+        # been held by another thread at fork time, and the inherited file
+        # descriptor belongs to the parent, so replace both without closing
+        # the parent's file.
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._fd = None
+            self._unsynced = 0
+            self._pid = os.getpid()
+
+    def _open(self):
+        if self._fd is None:
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+            self._fd = os.open(self.path, flags, 0o644)
+            self._unsynced = 0
+        return self._fd
+
+    def _check_rotated(self, fd):
+        """Reopen the live file if another writer or the replayer moved it.
+
+        Must be called with fd locked; returns the (locked) fd to write to.
+        """
+        while True:
+            try:
+                current = os.stat(self.path)
+            except OSError:
+                current = None
+            if current is not None and current.st_ino == os.fstat(fd).st_ino:
+                return fd
+            _funlock(fd)
+            os.close(fd)
+            self._fd = None
+            fd = self._open()
+            _flock(fd)
+
+    def _sync(self, fd, now):
+        if self._unsynced:
+            os.fsync(fd)
+            self._unsynced = 0
+        self._last_sync = now
+
+    def _rotate(self, fd):
+        """Move the live file aside. Must be called with fd locked."""
+        self._sync(fd, time.time())
+        timestamp = int(time.time() * 1000000)
+        while True:
+            rotated = "{}.{:020d}.{}".format(self.path, timestamp, os.getpid())
+            if not os.path.exists(rotated):
+                break
+            timestamp += 1
+        os.rename(self.path, rotated)
+
+        paths = self.rotated_paths()
+        for path in paths[: max(0, len(paths) - self.backup_count)]:
+            log.warning("Activity spool is full; dropping %s", path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _flock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _funlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
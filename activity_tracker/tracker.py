@@ -1,8 +1,9 @@
 from __future__ import absolute_import
 
-import importlib
 import six
 
+from .periods import PERIOD_DAILY, PERIOD_MONTHLY
+from .backends import get_backend_class
 from .backends.base import BaseBackend
 
 __all__ = ["ActivityTracker"]
@@ -15,7 +16,8 @@ class ActivityTracker(object):
         periods: A list of PERIOD_* constants for which activity should be
                  tracked. Used as a default for track() and collapse() calls.
         backend: The storage backend to use. Can be any of the following:
-                 - the name of a builtin backend ('redis')
+                 - the name of a builtin backend ('redis'), or of one added
+                   with activity_tracker.backends.register_backend()
                  - the fully qualified name of a backend class
                    ('foo.bar.CustomBackend')
                  - an instance of a subclass of
@@ -24,8 +26,8 @@ class ActivityTracker(object):
     Any additional keyword arguments are passed to the backend's constructor.
     """
 
-    PERIOD_DAILY = "daily"
-    PERIOD_MONTHLY = "monthly"
+    PERIOD_DAILY = PERIOD_DAILY
+    PERIOD_MONTHLY = PERIOD_MONTHLY
 
     def __init__(self, periods=None, backend=None, **kwargs):
         self._periods = periods
@@ -38,13 +40,7 @@ class ActivityTracker(object):
                     "backend instance."
                 )
         elif isinstance(backend, six.string_types):
-            if "." not in backend:
-                backend = "activity_tracker.backends.{}.{}Backend".format(
-                    backend, backend.title()
-                )
-            module_name, class_name = backend.rsplit(".", 1)
-            module = importlib.import_module(module_name)
-            self._backend = getattr(module, class_name)(**kwargs)
+            self._backend = get_backend_class(backend)(**kwargs)
         else:
             raise TypeError("Invalid backend")
 
@@ -85,6 +81,14 @@ class ActivityTracker(object):
         """Alias for track(periods=[PERIOD_MONTHLY], ...)."""
         return self.track(periods=[self.PERIOD_MONTHLY], **kwargs)
 
+    def replay_spool(self, **kwargs):
+        """Send any activity spooled while the backend was unavailable.
+
+        Keyword arguments are passed to the backend's replay_spool() method.
+        Returns the number of spooled records sent.
+        """
+        return self._backend.replay_spool(**kwargs)
+
     #
     # Collapse
     #
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Measure the cost of importing activity_tracker and constructing a tracker.
+
+Each sample runs a fresh interpreter, as a CLI tool or serverless cold start
+would, and the median of an empty interpreter's startup is subtracted.
+
+    $ python benchmarks/startup.py [--runs N]
+"""
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+import time
+
+BASELINE = "pass"
+IMPORT = "from activity_tracker.tracker import ActivityTracker"
+CONSTRUCT = IMPORT + "; ActivityTracker(backend='redis')"
+# Creates the client and pool, which imports redis, without connecting.
+CONNECT = CONSTRUCT + "._backend.get_conn(0)"
+
+
+def median_runtime(code, runs):
+    times = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code])
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    baseline = median_runtime(BASELINE, args.runs)
+    print("interpreter startup: {:8.2f} ms".format(baseline * 1000))
+    for name, code in [
+        ("import tracker", IMPORT),
+        ("construct tracker", CONSTRUCT),
+        ("create redis client", CONNECT),
+    ]:
+        elapsed = median_runtime(code, args.runs) - baseline
+        print("{:<20} +{:7.2f} ms".format(name + ":", elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
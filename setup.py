@@ -26,6 +26,9 @@ setup(
     url="https://github.com/educreations/activity-tracker",
     license="MIT",
     test_suite="tests",
+    entry_points={
+        "console_scripts": ["activity-tracker=activity_tracker.cli:main"],
+    },
     extras_require={"test": ["pytest", "pytest-django", "fakeredis", "flake8"]},
     classifiers=[
         "License :: OSI Approved :: MIT License",
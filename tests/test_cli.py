@@ -0,0 +1,53 @@
+"""
+Tests for the activity tracker command line tools.
+"""
+import datetime
+import unittest
+
+from fakeredis import FakeStrictRedis
+
+from activity_tracker import cli
+from activity_tracker.tracker import ActivityTracker
+
+
+class CollapseDaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tracker = ActivityTracker(
+            periods=[ActivityTracker.PERIOD_DAILY],
+            backend="redis",
+            shards=[{"db": 0}, {"db": 1}],
+            redis_client=FakeStrictRedis,
+        )
+        self.conns = [self.tracker._backend.get_conn(shard) for shard in (0, 1)]
+        for conn in self.conns:
+            conn.flushdb()
+
+    def tearDown(self):
+        for conn in self.conns:
+            conn.flushdb()
+
+    def test_next_period_boundary(self):
+        self.assertEqual(
+            datetime.datetime(2014, 2, 1),
+            cli.next_period_boundary(datetime.datetime(2014, 1, 31, 23, 59)),
+        )
+        self.assertEqual(
+            datetime.datetime(2014, 1, 2),
+            cli.next_period_boundary(datetime.datetime(2014, 1, 1)),
+        )
+
+    def test_collapse_all_shards(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.tracker.track(id=1, bucket="a", date=yesterday, shard=0)
+        self.tracker.track(id=2, bucket="b", date=yesterday, shard=1)
+
+        cli.run_collapse_daemon(self.tracker, num_shards=2, once=True)
+
+        period_str = "daily-{0:%Y%m%d}".format(yesterday)
+        self.assertEqual(b"1", self.conns[0].get("active:{}:a".format(period_str)))
+        self.assertEqual(b"1", self.conns[1].get("active:{}:b".format(period_str)))
+        self.assertFalse(self.conns[0].exists("active:{}:raw:a".format(period_str)))
+        self.assertFalse(self.conns[1].exists("active:{}:raw:b".format(period_str)))
+
+    def test_parse_aggregate(self):
+        self.assertEqual(("total", ["a", "b"]), cli.parse_aggregate("total=a,b"))
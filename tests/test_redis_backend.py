@@ -7,10 +7,16 @@ database. All data in that database will be destroyed.
 """
 import datetime
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import uuid
 
-from fakeredis import FakeStrictRedis
+from fakeredis import FakeConnection, FakeStrictRedis
+from redis import UnixDomainSocketConnection
+from redis.exceptions import ConnectionError
 import six
 
 from activity_tracker.backends import redis as redis_backend
@@ -68,6 +74,120 @@ class RedisBackendTestCase(unittest.TestCase):
         conn_keys = [t for t in map(force_text, self.conn.smembers(key))]
         self.assertEqual(set(args), set(conn_keys))
 
+    def test_get_conn_threads(self):
+        backend = redis_backend.RedisBackend(connection_class=FakeConnection)
+        conns = []
+        threads = [
+            threading.Thread(target=lambda: conns.append(backend.get_conn(0)))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8, len(conns))
+        self.assertEqual(1, len(set(id(conn) for conn in conns)))
+
+    def test_get_conn_after_fork(self):
+        backend = redis_backend.RedisBackend(connection_class=FakeConnection)
+        conn = backend.get_conn(0)
+        self.assertIs(conn, backend.get_conn(0))
+
+        # Pretend this process was forked from a parent with another pid.
+        backend._pid = -1
+        child_conn = backend.get_conn(0)
+        self.assertIsNot(conn, child_conn)
+        self.assertIsNot(conn.connection_pool, child_conn.connection_pool)
+        self.assertEqual(os.getpid(), backend._pid)
+
+    def test_share_pools(self):
+        def make_backend(**kwargs):
+            return redis_backend.RedisBackend(
+                connection_class=FakeConnection, max_connections=4, **kwargs
+            )
+
+        backend1 = make_backend(share_pools=True, shards=[{}, {"db": 1}])
+        backend2 = make_backend(share_pools=True)
+        backend3 = make_backend()
+        pool = backend1.get_conn(0).connection_pool
+        self.assertIs(pool, backend2.get_conn(0).connection_pool)
+        self.assertIsNot(pool, backend1.get_conn(1).connection_pool)
+        self.assertIsNot(pool, backend3.get_conn(0).connection_pool)
+        self.assertEqual(4, pool.max_connections)
+
+    def test_shared_pool_after_fork(self):
+        params = {"host": "localhost", "port": 6379, "db": 0}
+        lock = redis_backend._shared_pools_lock
+        pid = redis_backend._shared_pools_pid
+        self.addCleanup(setattr, redis_backend, "_shared_pools_lock", lock)
+        self.addCleanup(setattr, redis_backend, "_shared_pools_pid", pid)
+        pool = redis_backend.get_shared_pool(params)
+
+        # Pretend this process was forked while another thread held the lock.
+        lock.acquire()
+        self.addCleanup(lock.release)
+        redis_backend._shared_pools_pid = -1
+        child_pool = redis_backend.get_shared_pool(params)
+        self.assertIsNot(pool, child_pool)
+        self.assertIs(child_pool, redis_backend.get_shared_pool(params))
+
+    def test_custom_redis_client(self):
+        calls = []
+
+        def redis_client(**kwargs):
+            calls.append(kwargs)
+            return FakeStrictRedis(**kwargs)
+
+        backend = redis_backend.RedisBackend(
+            redis_client=redis_client, max_connections=4, shards=[{}, {"db": 1}]
+        )
+        self.assertIs(backend.get_conn(1), backend.get_conn(1))
+        backend.get_conn(0, socket_timeout=0.5)
+        self.assertEqual(
+            [
+                {
+                    "host": "localhost",
+                    "port": 6379,
+                    "db": 1,
+                    "socket_timeout": None,
+                    "max_connections": 4,
+                },
+                {
+                    "host": "localhost",
+                    "port": 6379,
+                    "db": 0,
+                    "socket_timeout": 0.5,
+                    "socket_connect_timeout": 0.5,
+                    "max_connections": 4,
+                },
+            ],
+            calls,
+        )
+        self.assertRaises(
+            ValueError,
+            redis_backend.RedisBackend,
+            redis_client=redis_client,
+            share_pools=True,
+        )
+
+    def test_unix_socket_pool(self):
+        pool = redis_backend.make_pool(
+            {
+                "host": "localhost",
+                "port": 6379,
+                "db": 2,
+                "unix_socket_path": "/tmp/redis.sock",
+                "socket_keepalive": True,
+                "health_check_interval": 30,
+            }
+        )
+        self.assertIs(UnixDomainSocketConnection, pool.connection_class)
+        self.assertEqual("/tmp/redis.sock", pool.connection_kwargs["path"])
+        self.assertEqual(2, pool.connection_kwargs["db"])
+        self.assertEqual(30, pool.connection_kwargs["health_check_interval"])
+        self.assertNotIn("host", pool.connection_kwargs)
+        self.assertNotIn("socket_keepalive", pool.connection_kwargs)
+
     def test_track(self):
         def track(**kwargs):
             self.backend.track(
@@ -89,11 +209,145 @@ class RedisBackendTestCase(unittest.TestCase):
             "active:daily-20140101:raw",
             "active:daily-20140101:raw:anon",
             "active:daily-20140101:raw:auth:staff",
+            "meta:daily-20140101:buckets",
         )
+        self.check_set("meta:daily-20140101:buckets", "", "anon", "auth:staff")
         self.check_set("active:daily-20140101:raw", "1")
         self.check_set("active:daily-20140101:raw:anon", UUID1, UUID2)
         self.check_set("active:daily-20140101:raw:auth:staff", "4", "5")
 
+    def test_track_spool(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        spool_path = os.path.join(tmpdir, "activity.spool")
+
+        # Nothing listens on port 1, so every track() call fails to connect.
+        down_backend = redis_backend.RedisBackend(
+            port=1, spool=spool_path, track_timeout=0.1
+        )
+        down_backend.track(
+            ActivityTracker.PERIOD_DAILY, id=1, date=datetime.date(2014, 1, 1)
+        )
+        down_backend.track(
+            ActivityTracker.PERIOD_DAILY,
+            id=2,
+            bucket="auth",
+            old_id=uuid.UUID(UUID1),
+            old_bucket="anon",
+            date=datetime.date(2014, 1, 1),
+        )
+        down_backend.spool.close()
+        self.check_keys()
+
+        no_spool_backend = redis_backend.RedisBackend(port=1, socket_timeout=0.1)
+        self.assertRaises(
+            ConnectionError,
+            no_spool_backend.track,
+            ActivityTracker.PERIOD_DAILY,
+            id=1,
+        )
+
+        self.conn.sadd("active:daily-20140101:raw:anon", UUID1, UUID2)
+        backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection, spool=spool_path
+        )
+        self.assertEqual(2, backend.replay_spool())
+
+        self.check_keys(
+            "active:daily-20140101:raw",
+            "active:daily-20140101:raw:anon",
+            "active:daily-20140101:raw:auth",
+            "meta:daily-20140101:buckets",
+        )
+        self.check_set("active:daily-20140101:raw", "1")
+        self.check_set("active:daily-20140101:raw:anon", UUID2)
+        self.check_set("active:daily-20140101:raw:auth", "2")
+        self.assertEqual(0, backend.replay_spool())
+
+    def test_track_spool_backoff(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        def track_calls(**kwargs):
+            backend = redis_backend.RedisBackend(
+                port=1, spool=os.path.join(tmpdir, "activity.spool"), **kwargs
+            )
+            calls = []
+            get_conn = backend.get_conn
+
+            def counting_get_conn(*args, **kwargs):
+                calls.append(args)
+                return get_conn(*args, **kwargs)
+
+            backend.get_conn = counting_get_conn
+            for id in range(3):
+                backend.track(ActivityTracker.PERIOD_DAILY, id=id)
+            backend.spool.close()
+            return len(calls)
+
+        self.assertEqual(1, track_calls())
+        self.assertEqual(3, track_calls(track_backoff=0))
+        spool = redis_backend.RedisBackend(
+            spool=os.path.join(tmpdir, "activity.spool")
+        ).spool
+        self.assertEqual(6, spool.replay(lambda batch: None))
+
+    def test_replay_after_collapse(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        spool_path = os.path.join(tmpdir, "activity.spool")
+
+        down_backend = redis_backend.RedisBackend(port=1, spool=spool_path)
+        self.assertEqual(0.1, down_backend.track_timeout)
+        for id in (1, 9):
+            down_backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                bucket="group1",
+                date=datetime.date(2014, 1, 1),
+            )
+        down_backend.spool.close()
+
+        self.backend.track(
+            ActivityTracker.PERIOD_DAILY, id=1, date=datetime.date(2014, 1, 1)
+        )
+        self.backend.track(
+            ActivityTracker.PERIOD_DAILY,
+            id=1,
+            bucket="group1",
+            date=datetime.date(2014, 1, 1),
+        )
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2)
+        )
+        self.assertEqual(
+            "1", force_text(self.conn.get("active:daily-20140101:group1"))
+        )
+
+        backend = redis_backend.RedisBackend(
+            redis_client=FakeStrictRedis, spool=spool_path
+        )
+        self.assertEqual(2, backend.replay_spool())
+        self.check_set("meta:late:daily", "daily-20140101")
+
+        backend.collapse(ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2))
+        self.check_keys(
+            "active:daily-20140101",
+            "active:daily-20140101:group1",
+            "meta:daily-20140101:collapsed",
+        )
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101")))
+        # id 1 was counted before the collapse and again when replayed.
+        self.assertEqual(
+            "3", force_text(self.conn.get("active:daily-20140101:group1"))
+        )
+
+    def test_track_spool_unwritable(self):
+        backend = redis_backend.RedisBackend(
+            port=1, spool="/nonexistent/activity.spool"
+        )
+        backend.track(ActivityTracker.PERIOD_DAILY, id=1)
+
     def test_collapse(self):
         self.conn.sadd("active:daily-20140101:raw:group1", "1", "2", "3")
         self.conn.sadd("active:daily-20140101:raw:group2", "1", "4", "5")
@@ -123,6 +377,7 @@ class RedisBackendTestCase(unittest.TestCase):
             "active:daily-20140101:agg2",
             "active:daily-20140101:agg3",
             "active:daily-20140102:raw:group1",
+            "meta:daily-20140101:collapsed",
         )
         self.assertEqual("3", force_text(self.conn.get("active:daily-20140101:group1")))
         self.assertEqual("3", force_text(self.conn.get("active:daily-20140101:group2")))
@@ -131,6 +386,352 @@ class RedisBackendTestCase(unittest.TestCase):
         self.assertEqual("5", force_text(self.conn.get("active:daily-20140101:agg2")))
         self.assertEqual("6", force_text(self.conn.get("active:daily-20140101:agg3")))
 
+    def test_collapse_registered_buckets(self):
+        def track(**kwargs):
+            self.backend.track(
+                ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 1), **kwargs
+            )
+
+        track(id=1)
+        track(id=2, bucket="group1")
+        track(id=3, bucket="group1")
+        track(id=3, bucket="group2")
+
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY,
+            date=datetime.date(2014, 1, 2),
+            aggregate_buckets={"total": ["group1", "group2"]},
+        )
+
+        self.check_keys(
+            "active:daily-20140101",
+            "active:daily-20140101:group1",
+            "active:daily-20140101:group2",
+            "active:daily-20140101:total",
+            "meta:daily-20140101:collapsed",
+        )
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101")))
+        self.assertEqual("2", force_text(self.conn.get("active:daily-20140101:group1")))
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101:group2")))
+        self.assertEqual("2", force_text(self.conn.get("active:daily-20140101:total")))
+
+    def test_collapse_checks_every_bucket(self):
+        # An old-style collapse left a count for group1 only.
+        self.conn.set("active:daily-20140101:group1", "3")
+        self.conn.sadd("active:daily-20131231:raw:group2", "1")
+
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY,
+            date=datetime.date(2014, 1, 2),
+            max_periods=5,
+            buckets=["group2", "group1"],
+        )
+
+        self.check_keys(
+            "active:daily-20140101:group1",
+            "active:daily-20131231:raw:group2",
+        )
+
+    def test_collapse_locked(self):
+        self.backend.track(
+            ActivityTracker.PERIOD_DAILY, id=1, date=datetime.date(2014, 1, 1)
+        )
+        self.conn.set("meta:lock:collapse:daily", "other")
+
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2), lock_timeout=60
+        )
+        self.assertFalse(self.conn.exists("meta:daily-20140101:collapsed"))
+
+        self.conn.delete("meta:lock:collapse:daily")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2), lock_timeout=60
+        )
+        self.assertTrue(self.conn.exists("meta:daily-20140101:collapsed"))
+        self.assertFalse(self.conn.exists("meta:lock:collapse:daily"))
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101")))
+
+    def test_collapse_lock_lost(self):
+        self.backend.track(
+            ActivityTracker.PERIOD_DAILY, id=1, date=datetime.date(2014, 1, 1)
+        )
+        scard = self.conn.scard
+
+        def steal_lock(key):
+            # Another daemon takes the lock after this one's has expired.
+            self.conn.set("meta:lock:collapse:daily", "other")
+            return scard(key)
+
+        self.conn.scard = steal_lock
+        self.addCleanup(delattr, self.conn, "scard")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY,
+            date=datetime.date(2014, 1, 2),
+            lock_timeout=60,
+        )
+        self.check_keys(
+            "active:daily-20140101:raw",
+            "meta:daily-20140101:buckets",
+            "meta:lock:collapse:daily",
+        )
+
+    def test_collapse_lock_renewed(self):
+        self.backend.track(
+            ActivityTracker.PERIOD_DAILY, id=1, date=datetime.date(2014, 1, 1)
+        )
+        scard = self.conn.scard
+
+        def slow_scard(key):
+            time.sleep(0.5)
+            return scard(key)
+
+        self.conn.scard = slow_scard
+        self.addCleanup(delattr, self.conn, "scard")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY,
+            date=datetime.date(2014, 1, 2),
+            lock_timeout=0.2,
+        )
+        self.check_keys("active:daily-20140101", "meta:daily-20140101:collapsed")
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101")))
+
+    def test_collapse_late_track(self):
+        def track(id, bucket=None):
+            self.backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                bucket=bucket,
+                date=datetime.date(2014, 1, 1),
+            )
+
+        track(1)
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2)
+        )
+        track(2)
+        track(2, bucket="b")
+        self.check_set("meta:late:daily", "daily-20140101")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 3)
+        )
+        self.check_keys(
+            "active:daily-20140101",
+            "active:daily-20140101:b",
+            "meta:daily-20140101:collapsed",
+            "meta:daily-20140102:collapsed",
+        )
+        self.assertEqual("2", force_text(self.conn.get("active:daily-20140101")))
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140101:b")))
+
+        # Raw data in the last collapsed period is collapsed even if it was
+        # never marked as late.
+        self.conn.sadd("active:daily-20140102:raw", "3")
+        self.conn.sadd("meta:daily-20140102:buckets", "")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 3)
+        )
+        self.assertEqual("1", force_text(self.conn.get("active:daily-20140102")))
+        self.assertFalse(self.conn.exists("meta:daily-20140102:buckets"))
+
+    def test_dimensions(self):
+        backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection,
+            dimensions=["platform", "plan", "region"],
+        )
+
+        def track(id, platform, plan, region, **kwargs):
+            backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                dimensions={"platform": platform, "plan": plan, "region": region},
+                date=datetime.date(2014, 1, 1),
+                **kwargs
+            )
+
+        track(1, "ios", "paid", "us")
+        track(2, "ios", "free", "us")
+        track(3, "android", "paid", "eu")
+        track(1, "android", "paid", "us")
+        track(4, "ios", "free", "eu")
+        track(
+            5,
+            "ios",
+            "paid",
+            "eu",
+            old_id=4,
+            old_dimensions={"platform": "ios", "plan": "free", "region": "eu"},
+        )
+        self.check_set("active:daily-20140101:raw:dims:ios,paid,us", "1")
+        self.check_set("active:daily-20140101:raw:dims:ios,paid,eu", "5")
+
+        backend.collapse(ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2))
+
+        conn_keys = set(map(force_text, self.conn.keys()))
+        self.assertEqual(8 + 1, len(conn_keys))
+        self.assertIn("meta:daily-20140101:collapsed", conn_keys)
+        self.assertIn("active:daily-20140101:dims:*", conn_keys)
+        self.assertIn("active:daily-20140101:dims:platform,plan,region", conn_keys)
+
+        def lookup(**kwargs):
+            return backend.lookup(
+                ActivityTracker.PERIOD_DAILY,
+                start=datetime.date(2014, 1, 1),
+                end=datetime.date(2014, 1, 2),
+                **kwargs
+            )
+
+        self.assertEqual([(datetime.date(2014, 1, 1), {(): 4})], lookup(group_by=[]))
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {("ios",): 3, ("android",): 2})],
+            lookup(group_by=["platform"]),
+        )
+        self.assertEqual(
+            [
+                (
+                    datetime.date(2014, 1, 1),
+                    {("paid", "ios"): 2, ("paid", "android"): 2, ("free", "ios"): 1},
+                )
+            ],
+            lookup(group_by=["plan", "platform"]),
+        )
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {("us",): 1, ("eu",): 1})],
+            lookup(group_by=["region"], filter={"plan": "paid", "platform": "ios"}),
+        )
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {(): 3})],
+            lookup(filter={"plan": "paid"}),
+        )
+
+    def test_dimensions_rollups(self):
+        backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection,
+            dimensions=["platform", "plan"],
+            rollups=[["plan"], []],
+        )
+        tracks = [(1, "ios", "paid"), (1, "web", "paid"), (2, "web", "free")]
+        for id, platform, plan in tracks:
+            backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                dimensions={"platform": platform, "plan": plan},
+                date=datetime.date(2014, 1, 1),
+            )
+        backend.collapse(ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2))
+
+        self.check_keys(
+            "active:daily-20140101:dims:plan",
+            "active:daily-20140101:dims:*",
+            "meta:daily-20140101:collapsed",
+        )
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {("paid",): 1, ("free",): 1})],
+            backend.lookup(
+                ActivityTracker.PERIOD_DAILY,
+                start=datetime.date(2014, 1, 1),
+                end=datetime.date(2014, 1, 2),
+                group_by=["plan"],
+            ),
+        )
+        self.assertRaises(
+            ValueError,
+            backend.lookup,
+            ActivityTracker.PERIOD_DAILY,
+            group_by=["platform"],
+        )
+
+    def test_dimensions_collapse_without_schema(self):
+        dims_backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection, dimensions=["platform", "plan"]
+        )
+        tracks = [(1, "ios", "x y"), (2, "ios x", "y"), (3, "web", "paid")]
+        for id, platform, plan in tracks:
+            dims_backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                dimensions={"platform": platform, "plan": plan},
+                date=datetime.date(2014, 1, 1),
+            )
+        self.assertEqual(
+            "platform,plan", force_text(self.conn.get("meta:daily-20140101:dimensions"))
+        )
+
+        backend = redis_backend.RedisBackend(connection_class=FakeConnection)
+        backend.collapse(ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2))
+        self.assertFalse(self.conn.exists("meta:daily-20140101:dimensions"))
+
+        def lookup(**kwargs):
+            return dims_backend.lookup(
+                ActivityTracker.PERIOD_DAILY,
+                start=datetime.date(2014, 1, 1),
+                end=datetime.date(2014, 1, 2),
+                **kwargs
+            )
+
+        self.assertEqual([(datetime.date(2014, 1, 1), {(): 3})], lookup(group_by=[]))
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {("ios",): 1, ("ios x",): 1, ("web",): 1})],
+            lookup(group_by=["platform"]),
+        )
+
+    def test_dimensions_non_ascii(self):
+        backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection, dimensions=["platform", "region"]
+        )
+        for id, platform in ((1, "ios"), (2, "web")):
+            backend.track(
+                ActivityTracker.PERIOD_DAILY,
+                id=id,
+                dimensions={"platform": platform, "region": u"\u6771\u4eac"},
+                date=datetime.date(2014, 1, 1),
+            )
+        backend.collapse(ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2))
+
+        self.assertEqual(
+            [(datetime.date(2014, 1, 1), {(u"\u6771\u4eac",): 2})],
+            backend.lookup(
+                ActivityTracker.PERIOD_DAILY,
+                start=datetime.date(2014, 1, 1),
+                end=datetime.date(2014, 1, 2),
+                group_by=["region"],
+            ),
+        )
+
+    def test_dimensions_collapse_unknown_schema(self):
+        self.conn.sadd("active:daily-20140101:raw:dims:ios,paid", "1")
+        self.conn.sadd("meta:daily-20140101:buckets", "dims:ios,paid")
+        self.backend.collapse(
+            ActivityTracker.PERIOD_DAILY, date=datetime.date(2014, 1, 2)
+        )
+        self.check_keys(
+            "active:daily-20140101:raw:dims:ios,paid", "meta:daily-20140101:buckets"
+        )
+
+    def test_dimensions_invalid(self):
+        backend = redis_backend.RedisBackend(
+            connection_class=FakeConnection, dimensions=["platform", "plan"]
+        )
+
+        def track(**kwargs):
+            backend.track(ActivityTracker.PERIOD_DAILY, id=1, **kwargs)
+
+        self.assertRaises(ValueError, track, dimensions={"platform": "ios"})
+        self.assertRaises(
+            ValueError, track, dimensions={"platform": "ios", "plan": "a,b"}
+        )
+        self.assertRaises(
+            ValueError,
+            track,
+            bucket="anon",
+            dimensions={"platform": "ios", "plan": "paid"},
+        )
+        self.assertRaises(
+            ValueError,
+            redis_backend.RedisBackend,
+            dimensions=["platform"],
+            rollups=[["region"]],
+        )
+
     def test_lookup(self):
         self.conn.set("active:monthly-201310:group1", "83")
         self.conn.set("active:monthly-201311:group1", "5")
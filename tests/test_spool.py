@@ -0,0 +1,92 @@
+"""
+Tests for the activity tracker local spool.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from activity_tracker.spool import Spool
+
+
+class SpoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "activity.spool")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def replay(self, spool, **kwargs):
+        batches = []
+        count = spool.replay(batches.append, **kwargs)
+        return count, batches
+
+    def test_append_replay(self):
+        spool = Spool(self.path)
+        for i in range(5):
+            spool.append({"n": i})
+
+        count, batches = self.replay(spool, batch_size=2)
+
+        self.assertEqual(5, count)
+        self.assertEqual(
+            [[{"n": 0}, {"n": 1}], [{"n": 2}, {"n": 3}], [{"n": 4}]], batches
+        )
+        self.assertEqual([], os.listdir(self.tmpdir))
+
+        # Appends after a replay start a new file.
+        spool.append({"n": 5})
+        self.assertEqual((1, [[{"n": 5}]]), self.replay(spool))
+
+    def test_replay_empty(self):
+        self.assertEqual((0, []), self.replay(Spool(self.path)))
+
+    def test_rotate(self):
+        spool = Spool(self.path, max_bytes=1, backup_count=2)
+        for i in range(8):
+            spool.append({"n": i})
+
+        # Each record fills a file; only the newest 2 rotated files are kept.
+        self.assertEqual(2, len(spool.rotated_paths()))
+        count, batches = self.replay(spool)
+        self.assertEqual(2, count)
+        self.assertEqual([[{"n": 6}], [{"n": 7}]], batches)
+
+    def test_replay_failure(self):
+        spool = Spool(self.path)
+        spool.append({"n": 0})
+
+        def fail(batch):
+            raise RuntimeError()
+
+        self.assertRaises(RuntimeError, spool.replay, fail)
+        spool.append({"n": 1})
+        self.assertEqual((2, [[{"n": 0}], [{"n": 1}]]), self.replay(spool))
+
+    def test_reopen_after_external_rotation(self):
+        spool1 = Spool(self.path)
+        spool2 = Spool(self.path)
+        spool1.append({"n": 0})
+        spool2.append({"n": 1})
+        self.assertEqual((2, [[{"n": 0}, {"n": 1}]]), self.replay(spool2))
+
+        # spool1 still has the replayed file open, and must not write to it.
+        spool1.append({"n": 2})
+        self.assertEqual((1, [[{"n": 2}]]), self.replay(spool2))
+        spool1.close()
+        spool2.close()
+
+    def test_append_after_fork(self):
+        spool = Spool(self.path)
+        spool.append({"n": 0})
+
+        # Pretend this process was forked while another thread was appending.
+        lock = spool._lock
+        lock.acquire()
+        self.addCleanup(lock.release)
+        spool._pid = -1
+        spool.append({"n": 1})
+        self.assertEqual(os.getpid(), spool._pid)
+        self.assertEqual((2, [[{"n": 0}, {"n": 1}]]), self.replay(spool))
+        spool.close()
@@ -0,0 +1,63 @@
+"""
+Tests for the activity tracker frontend and backend resolution.
+"""
+import subprocess
+import sys
+import unittest
+
+from activity_tracker import backends
+from activity_tracker.backends.base import BaseBackend
+from activity_tracker.backends.redis import RedisBackend
+from activity_tracker.tracker import ActivityTracker
+
+
+class DummyBackend(BaseBackend):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.calls = []
+
+    def track(self, period, **kwargs):
+        self.calls.append((period, kwargs))
+
+
+class ActivityTrackerTestCase(unittest.TestCase):
+    def tearDown(self):
+        backends._backends.pop("dummy", None)
+        backends._backend_classes.pop("dummy", None)
+
+    def test_builtin_backend(self):
+        tracker = ActivityTracker(backend="redis", db=3)
+        self.assertIsInstance(tracker._backend, RedisBackend)
+        self.assertEqual(3, tracker._backend.defaults["db"])
+        self.assertIs(RedisBackend, backends._backend_classes["redis"])
+
+    def test_dotted_backend(self):
+        tracker = ActivityTracker(backend="tests.test_tracker.DummyBackend", foo=1)
+        self.assertIsInstance(tracker._backend, DummyBackend)
+        self.assertEqual({"foo": 1}, tracker._backend.kwargs)
+
+    def test_register_backend(self):
+        backends.register_backend("dummy", DummyBackend)
+        tracker = ActivityTracker(
+            periods=[ActivityTracker.PERIOD_DAILY], backend="dummy"
+        )
+        tracker.track(id=1)
+        self.assertEqual([("daily", {"id": 1})], tracker._backend.calls)
+
+        backends.register_backend("dummy", "tests.test_tracker.DummyBackend")
+        self.assertIs(DummyBackend, backends.get_backend_class("dummy"))
+
+    def test_backend_instance(self):
+        backend = DummyBackend()
+        self.assertIs(backend, ActivityTracker(backend=backend)._backend)
+        self.assertRaises(ValueError, ActivityTracker, backend=backend, foo=1)
+        self.assertRaises(TypeError, ActivityTracker, backend=None)
+
+    def test_lazy_redis_import(self):
+        code = (
+            "import sys\n"
+            "from activity_tracker.tracker import ActivityTracker\n"
+            "ActivityTracker(backend='redis')\n"
+            "assert 'redis' not in sys.modules, 'redis was imported'\n"
+        )
+        subprocess.check_call([sys.executable, "-c", code])